@@ -12,8 +12,8 @@ Rewritten to match p5.js acoustic character using clean harmonic oscillators:
 """
 
 import numpy as np
-from scipy.io import wavfile
-from scipy.signal import sawtooth
+from scipy.signal import lfilter
+import struct
 import subprocess
 import sys
 from pathlib import Path
@@ -80,11 +80,29 @@ VOLTAGE_SAG_TIME = 1.0  # Voltage sag duration (1 second into cranking)
 
 # ============ PHASE TRACKING FOR SMOOTH FREQUENCY RAMPING ============
 # Key insight: Use phase accumulation for smooth, alias-free sweeps
-main_phase = 0.0
-gear_phase = 0.0
-hum_phase = 0.0
+# Phase is the integral of frequency, evaluated in closed form over the whole buffer
 dt = 1.0 / SAMPLE_RATE
 
+
+# ============ HELPERS ============
+
+def write_wav_pcm16(path, sample_rate, samples):
+    """Write mono 16-bit PCM: a 44-byte RIFF/WAVE header followed by the raw samples."""
+    data = samples.astype('<i2', copy=False).tobytes()
+    header = struct.pack('<4sI4s4sIHHIIHH4sI',
+                         b'RIFF', 36 + len(data), b'WAVE',
+                         b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,  # PCM, mono, 16-bit
+                         b'data', len(data))
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(data)
+
+
+def wrapped_phase(cycles):
+    """Phase in [0, 2*pi) as float32; dropping whole cycles first keeps full precision."""
+    return (2 * np.pi * (cycles % 1.0)).astype(np.float32)
+
+
 # ============ GENERATION ============
 
 print("Generating starter motor sound scaled by ACTUAL MOTOR SHAFT RPM (not engine RPM)...")
@@ -95,140 +113,169 @@ print(f"  gearOsc: triangle 166→1160 Hz (2x metallic gear-teeth)")
 print(f"  humOsc: sine 41→290 Hz (0.5x deep sub-harmonic)")
 
 total_samples = int(SAMPLE_RATE * DURATION)
-audio = np.zeros(total_samples)
-
-# Pre-allocate noise state for colored noise
-noise_state = 0.0
-
-for i in range(total_samples):
-    t = i / SAMPLE_RATE
-
-    # ---- RPM PROGRESSION ----
-    # Phase 1: Solenoid engagement (0-0.15s) - click/initial kick
-    if t < ENGAGE_TIME:
-        rpm = RPM_ENGAGE
-        # Soft start into engagement
-        engagement_progress = t / ENGAGE_TIME
-        engagement_envelope = np.sin(engagement_progress * np.pi / 2) ** 0.5
-    # Phase 2: Spin-up ramp (0.15s - 2.65s) - struggling under load
-    elif t < ENGAGE_TIME + RAMPUP_TIME:
-        progress = (t - ENGAGE_TIME) / RAMPUP_TIME
-        # Cubic easing for more natural acceleration
-        progress_eased = progress ** 1.5
-        rpm = RPM_ENGAGE + (RPM_TARGET - RPM_ENGAGE) * progress_eased
-        engagement_envelope = 1.0
-    # Phase 3: Steady cranking (2.65s+)
-    else:
-        rpm = RPM_TARGET
-        engagement_envelope = 1.0
-
-    # ---- VOLTAGE SAG SIMULATION (12V ELECTRICAL EFFECT) ----
-    # Battery voltage sags under high current draw of starter motor
-    if t < VOLTAGE_SAG_TIME:
-        # Voltage sag during heavy load phase
-        sag_progress = t / VOLTAGE_SAG_TIME
-        voltage_sag = np.cos(sag_progress * np.pi / 2) ** 1.5  # Exponential recovery
-        voltage = VOLTAGE_INITIAL + (VOLTAGE_MIN_SAG - VOLTAGE_INITIAL) * (1 - voltage_sag)
-    else:
-        # Voltage stabilizes after initial load phase
-        voltage = VOLTAGE_INITIAL + (VOLTAGE_NOMINAL - VOLTAGE_INITIAL) * 0.5
-
-    # Voltage affects motor performance (normalized 0-1, where 1.0 = 12V)
-    voltage_factor = voltage / VOLTAGE_NOMINAL  # 0.9-1.0 typically
-
-    # ---- FREQUENCY MODULATION BY LOAD ----
-    # Pure cranking phase (0-3s): smooth, no load pulses for clean baseline
-    # Optional: load effects after firing (3+s) could be added here
-    # For now: keep smooth throughout for clean electrical whine character
-    load_mod = 1.0  # No 8 Hz load pulses during cranking phase
-
-    # Convert engine RPM to motor shaft RPM using gear ratio
-    motor_rpm = rpm * MOTOR_GEAR_RATIO
-
-    # Voltage sag reduces effective RPM (weaker motor under low voltage)
-    freq_modulated = (motor_rpm / MOTOR_RPM_TARGET) * MAIN_OSC_BASE * load_mod * (0.95 + 0.05 * voltage_factor)
-
-    # ---- GENERATE THREE-OSCILLATOR SIGNAL ----
-    # Smooth phase accumulation for alias-free frequency ramping
+
+# Whole-buffer synthesis: every stage below operates on arrays of total_samples.
+# Working buffers are float32 (output is int16); only the phase integral needs float64.
+t_precise = np.arange(total_samples) / SAMPLE_RATE
+t = t_precise.astype(np.float32)
+
+# ---- RPM PROGRESSION ----
+# Phase 1: Solenoid engagement (0-0.15s) - click/initial kick
+# Phase 2: Spin-up ramp (0.15s - 2.65s) - struggling under load
+# Phase 3: Steady cranking (2.65s+)
+# Branchless: progress is clamped to 0 before the ramp and 1 after it, so one
+# expression yields RPM_ENGAGE, the eased ramp and RPM_TARGET in turn.
+progress = (t - ENGAGE_TIME) / RAMPUP_TIME
+# Cubic easing for more natural acceleration (p^1.5 as p*sqrt(p): no pow() call)
+ramp_progress = np.clip(progress, 0.0, 1.0)
+progress_eased = ramp_progress * np.sqrt(ramp_progress)
+rpm = RPM_ENGAGE + (RPM_TARGET - RPM_ENGAGE) * progress_eased
+
+# Soft start into engagement (sin(pi/2) = 1 once engaged)
+engagement_progress = np.minimum(t / ENGAGE_TIME, 1.0)
+engagement_envelope = np.sqrt(np.sin(engagement_progress * np.pi / 2))
+
+# ---- VOLTAGE SAG SIMULATION (12V ELECTRICAL EFFECT) ----
+# Battery voltage sags under high current draw of starter motor,
+# then stabilizes after the initial load phase (a genuine step at VOLTAGE_SAG_TIME,
+# so this one keeps a select)
+sag_progress = np.minimum(t / VOLTAGE_SAG_TIME, 1.0)
+# (cos(pi/2) rounds slightly negative in float32, hence the clamp)
+voltage_cos = np.maximum(np.cos(sag_progress * np.pi / 2), 0.0)
+voltage_sag = voltage_cos * np.sqrt(voltage_cos)  # cos^1.5: Exponential recovery
+voltage_settled = VOLTAGE_INITIAL + (VOLTAGE_NOMINAL - VOLTAGE_INITIAL) * 0.5
+sagging = t < VOLTAGE_SAG_TIME
+voltage = np.where(sagging,
+                   VOLTAGE_INITIAL + (VOLTAGE_MIN_SAG - VOLTAGE_INITIAL) * (1 - voltage_sag),
+                   voltage_settled)
+
+# Voltage affects motor performance (normalized 0-1, where 1.0 = 12V)
+voltage_factor = voltage / VOLTAGE_NOMINAL  # 0.9-1.0 typically
+
+# ---- FREQUENCY MODULATION BY LOAD ----
+# Pure cranking phase (0-3s): smooth, no load pulses for clean baseline
+# Optional: load effects after firing (3+s) could be added here
+# For now: keep smooth throughout for clean electrical whine character
+load_mod = 1.0  # No 8 Hz load pulses during cranking phase
+
+# Convert engine RPM to motor shaft RPM using gear ratio, then to mainOsc Hz
+freq_scale = MOTOR_GEAR_RATIO / MOTOR_RPM_TARGET * MAIN_OSC_BASE * load_mod  # Hz per engine RPM
+
+# ---- PHASE: EXACT INTEGRAL OF THE FREQUENCY SCHEDULE ----
+# Oscillator phase is 2*pi * integral of frequency. The RPM schedule integrates in
+# closed form piece by piece (flat engage, p^1.5 ease -> p^2.5 / 2.5, flat target),
+# so there is no running sum to drift over long renders.
+# Cycle counts reach the thousands, so this runs on the float64 time axis.
+ramp_precise = np.clip((t_precise - ENGAGE_TIME) / RAMPUP_TIME, 0.0, 1.0)
+rpm_integral = RPM_ENGAGE * t_precise + (RPM_TARGET - RPM_ENGAGE) * (
+    RAMPUP_TIME * ramp_precise * ramp_precise * np.sqrt(ramp_precise) / 2.5 + np.maximum(t_precise - ENGAGE_TIME - RAMPUP_TIME, 0.0))
+
+# The voltage-sag deviation (cos^1.5 recovery times the RPM ramp) has no elementary
+# integral; it only lasts VOLTAGE_SAG_TIME, so sum just that window numerically
+voltage_factor_settled = voltage_settled / VOLTAGE_NOMINAL
+# sag_integral[k] sums samples before k, so a window that runs to the end of the
+# buffer never needs its final sample
+sag_samples = min(np.count_nonzero(sagging), total_samples - 1)
+sag_integral = np.zeros(total_samples)
+sag_integral[1:sag_samples + 1] = np.cumsum(
+    rpm[:sag_samples] * (voltage_factor[:sag_samples] - voltage_factor_settled), dtype=np.float64) * dt
+sag_integral[sag_samples + 1:] = sag_integral[sag_samples]
+
+# Cycles completed by the fundamental (mainOsc) at each sample
+# Voltage sag reduces effective RPM (weaker motor under low voltage)
+settled_freq_scale = freq_scale * (0.95 + 0.05 * voltage_factor_settled)  # Hz per RPM, settled voltage
+sag_freq_scale = freq_scale * 0.05
+main_cycles = settled_freq_scale * rpm_integral + sag_freq_scale * sag_integral
+
+# ---- GENERATE THREE-OSCILLATOR SIGNAL ----
+# Smooth phase from the integrated frequency for alias-free frequency ramping
+harmonic_signal = np.empty(total_samples, dtype=np.float32)
+
+
+def render_oscillators(start, stop):
+    """Fill harmonic_signal[start:stop].
+
+    Phase comes from the closed-form main_cycles, so each block starts at its
+    exact phase and needs nothing from its neighbours.
+    """
+    cycles = main_cycles[start:stop]
 
     # mainOsc: Fundamental sine wave (1.0x ratio)
     # Scales from ~16 Hz (at 0 RPM) to 100 Hz (at 250 RPM)
-    main_freq = freq_modulated
-    main_phase += 2 * np.pi * main_freq * dt
+    main_phase = wrapped_phase(cycles)
     main_osc = np.sin(main_phase)
 
     # gearOsc: Triangle wave at 2.0x fundamental (gear-teeth metallic character)
     # Scales from ~32 Hz to 200 Hz - harsh metallic sound
-    gear_freq = freq_modulated * GEAR_OSC_RATIO
-    gear_phase += 2 * np.pi * gear_freq * dt
-    # Triangle wave from -pi to pi phase: sawtooth(x) produces triangle with proper band-limiting
-    # sawtooth(phase, width=0.5) gives symmetric triangle wave
-    gear_osc = sawtooth(gear_phase, width=0.5)
+    gear_phase = wrapped_phase(GEAR_OSC_RATIO * cycles)
+    # Symmetric triangle wave (same as scipy sawtooth(phase, width=0.5)), computed inline
+    # from the wrapped phase: rises -1 -> 1 over [0, pi), falls back over [pi, 2*pi)
+    gear_osc = 1.0 - 2.0 * np.abs(gear_phase * (1.0 / np.pi) - 1.0)
 
     # humOsc: Sub-harmonic sine at 0.5x fundamental (deep resonance)
     # Scales from ~8 Hz to 50 Hz - adds richness and body
-    hum_freq = freq_modulated * HUM_OSC_RATIO
-    hum_phase += 2 * np.pi * hum_freq * dt
+    hum_phase = wrapped_phase(HUM_OSC_RATIO * cycles)
     hum_osc = np.sin(hum_phase)
 
     # Combine three oscillators with their mixing ratios
-    harmonic_signal = (
+    harmonic_signal[start:stop] = (
         MAIN_OSC_AMP * main_osc +
         GEAR_OSC_AMP * gear_osc +
         HUM_OSC_AMP * hum_osc
     )
 
-    # ---- BROADBAND MECHANICAL NOISE ----
-    # White noise filtered for mechanical character (42% - unchanged, verified working)
-    noise_white = np.random.uniform(-1, 1)
-    # Colored noise by running sum (simple low-pass filter = pink-ish)
-    noise_colored = noise_white * 0.5 + noise_state * 0.5
-    noise_state = noise_colored
-    noise = noise_colored
-
-    # ---- COMBINE HARMONIC OSCILLATORS + BROADBAND NOISE ----
-    # Normalize harmonic energy (0.78) + broadband noise (0.42)
-    signal = (
-        harmonic_signal * (1.0 - NOISE_AMOUNT) +  # Harmonics at ~58%
-        noise * NOISE_AMOUNT                      # Broadband noise at ~42%
-    )
 
-    # Voltage sag reduces amplitude (weaker electromagnetic force under low voltage)
-    signal *= (0.92 + 0.08 * voltage_factor)  # 8% amplitude reduction at min voltage
+# Fixed 64k-sample blocks keep each block's temporaries cache-resident; the whole
+# stage is ~15 ms, so smaller blocks (or threads) only add overhead
+block_size = 65536
+for start in range(0, total_samples, block_size):
+    render_oscillators(start, min(start + block_size, total_samples))
 
-    # ---- ENVELOPE & AMPLITUDE SHAPING ----
-    # Fade in from solenoid engagement
-    if t < 0.2:
-        envelope = t / 0.2  # 200ms gentle fade in
-    elif t > DURATION - 0.3:
-        envelope = max(0.0, (DURATION - t) / 0.3)  # 300ms fade out
-    else:
-        envelope = 1.0
+# ---- BROADBAND MECHANICAL NOISE ----
+# White noise filtered for mechanical character (42% - unchanged, verified working)
+# Drawn in one bulk call; fixed seed keeps regenerated WAVs reproducible
+rng = np.random.default_rng(0)
+noise_white = rng.uniform(-1, 1, total_samples).astype(np.float32)
+# Colored noise by running sum (simple low-pass filter = pink-ish):
+# y[n] = 0.5 * x[n] + 0.5 * y[n-1], a first-order AR process. float32
+# coefficients keep lfilter on its float32 path (float64 ones would upcast).
+noise = lfilter(np.array([0.5], dtype=np.float32), np.array([1.0, -0.5], dtype=np.float32), noise_white)
 
-    # Apply engagement envelope (solenoid kick)
-    envelope *= engagement_envelope
+# ---- COMBINE HARMONIC OSCILLATORS + BROADBAND NOISE ----
+# Normalize harmonic energy (0.78) + broadband noise (0.42)
+signal = (
+    harmonic_signal * (1.0 - NOISE_AMOUNT) +  # Harmonics at ~58%
+    noise * NOISE_AMOUNT                      # Broadband noise at ~42%
+)
 
-    # Amplitude ramp during spin-up (motor gets "louder" as it engages)
-    if t < ENGAGE_TIME + RAMPUP_TIME:
-        spin_up_progress = min(1.0, (t - ENGAGE_TIME) / (RAMPUP_TIME * 0.7))
-        amplitude_ramp = 0.3 + 0.7 * spin_up_progress  # Start quiet, ramp to full
-    else:
-        amplitude_ramp = 1.0
+# Voltage sag reduces amplitude (weaker electromagnetic force under low voltage)
+signal *= (0.92 + 0.08 * voltage_factor)  # 8% amplitude reduction at min voltage
 
-    audio[i] = signal * envelope * amplitude_ramp
+# ---- ENVELOPE & AMPLITUDE SHAPING ----
+# 200ms gentle fade in from solenoid engagement, 300ms fade out
+envelope = np.clip(np.minimum(t / 0.2, (DURATION - t) / 0.3), 0.0, 1.0)
 
-# ---- POST-PROCESSING ----
-# Normalize to 0.9 of max range (avoid clipping)
-max_val = np.max(np.abs(audio))
-if max_val > 0:
-    audio = audio / max_val * 0.85
+# Apply engagement envelope (solenoid kick)
+envelope *= engagement_envelope
 
-# Convert to int16
-audio_int16 = (audio * 32767).astype(np.int16)
+# Amplitude ramp during spin-up (motor gets "louder" as it engages)
+# spin_up_progress saturates at 1 well before the ramp ends, giving full amplitude after it
+spin_up_progress = np.minimum(1.0, (t - ENGAGE_TIME) / (RAMPUP_TIME * 0.7))
+amplitude_ramp = 0.3 + 0.7 * spin_up_progress  # Start quiet, ramp to full
+
+audio = signal * envelope * amplitude_ramp
+
+# ---- POST-PROCESSING ----
+# Normalize to 0.85 of max range (avoid clipping) and convert to int16 in one scaling pass
+peak = max(audio.max(), -audio.min())
+scale = 0.85 * 32767 / peak if peak > 0 else 0.0
+np.multiply(audio, scale, out=audio)
+np.rint(audio, out=audio)
+audio_int16 = audio.astype(np.int16)
 
 # Save WAV
 output_path = str(Path(__file__).with_suffix('.wav'))
-wavfile.write(output_path, SAMPLE_RATE, audio_int16)
+write_wav_pcm16(output_path, SAMPLE_RATE, audio_int16)
 
 print(f"\n✓ Generated: {output_path}")
 print(f"\n12V AUTOMOTIVE STARTER SPECIFICATIONS:")
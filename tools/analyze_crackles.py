@@ -13,10 +13,12 @@ Detects:
 import struct
 import sys
 import os
-import math
 
-def read_wav(filepath):
-    """Read WAV file and return sample data + metadata."""
+import numpy as np
+
+
+def read_wav_header(filepath):
+    """Parse WAV chunks and return metadata plus the location of the sample data."""
     with open(filepath, 'rb') as f:
         # RIFF header
         riff = f.read(4)
@@ -33,7 +35,8 @@ def read_wav(filepath):
         num_channels = 0
         sample_rate = 0
         bits_per_sample = 0
-        samples = []
+        data_offset = 0
+        data_size = 0
 
         while True:
             chunk_id = f.read(4)
@@ -57,25 +60,14 @@ def read_wav(filepath):
             elif chunk_id == b'data':
                 if not fmt_found:
                     raise ValueError("data chunk before fmt chunk")
-
-                # Read sample data
-                if audio_format == 3:  # IEEE float
-                    num_samples = chunk_size // 4
-                    for _ in range(num_samples):
-                        raw = f.read(4)
-                        if len(raw) < 4:
-                            break
-                        samples.append(struct.unpack('<f', raw)[0])
-                elif audio_format == 1:  # PCM int16
-                    num_samples = chunk_size // 2
-                    for _ in range(num_samples):
-                        raw = f.read(2)
-                        if len(raw) < 2:
-                            break
-                        val = struct.unpack('<h', raw)[0]
-                        samples.append(val / 32768.0)
-                else:
+                if audio_format not in (1, 3):  # PCM int16 / IEEE float
                     raise ValueError(f"Unsupported audio format: {audio_format}")
+
+                # Samples are streamed later by iter_wav_blocks; a truncated file
+                # only has the bytes actually present
+                data_offset = f.tell()
+                data_size = min(chunk_size, os.fstat(f.fileno()).st_size - data_offset)
+                f.seek(chunk_size, os.SEEK_CUR)
                 data_found = True
             else:
                 f.read(chunk_size)
@@ -83,19 +75,139 @@ def read_wav(filepath):
     if not fmt_found or not data_found:
         raise ValueError("Missing fmt or data chunk")
 
+    sample_width = 4 if audio_format == 3 else 2
     return {
-        'samples': samples,
+        'filepath': filepath,
         'sample_rate': sample_rate,
         'num_channels': num_channels,
         'bits_per_sample': bits_per_sample,
         'audio_format': audio_format,
-        'num_frames': len(samples) // num_channels
+        'data_offset': data_offset,
+        'num_frames': data_size // sample_width // num_channels
     }
 
 
-def analyze_crackles(wav_data, skip_seconds=0.0):
-    """Analyze WAV for crackle-causing discontinuities."""
-    samples = wav_data['samples']
+def iter_wav_blocks(wav_data, block_frames=65536, start_frame=0):
+    """Yield float32 sample blocks of shape (frames, channels), starting at start_frame.
+
+    float32 holds int16 and float32 WAV samples exactly; reductions over them
+    accumulate in float64.
+    """
+    ch = wav_data['num_channels']
+    dtype = np.dtype('<f4' if wav_data['audio_format'] == 3 else '<i2')
+    frame_bytes = dtype.itemsize * ch
+    remaining = wav_data['num_frames'] - start_frame
+
+    with open(wav_data['filepath'], 'rb') as f:
+        # Skipped frames are never read or decoded
+        f.seek(wav_data['data_offset'] + start_frame * frame_bytes)
+        while remaining > 0:
+            buf = f.read(min(block_frames, remaining) * frame_bytes)
+            frames = len(buf) // frame_bytes
+            if frames == 0:
+                break
+            samples = np.frombuffer(buf, dtype=dtype, count=frames * ch)
+            if wav_data['audio_format'] == 1:
+                samples = samples.astype(np.float32)
+                samples *= np.float32(1.0 / 32768.0)
+            else:
+                # Already float32: a read-only view of the read buffer, no copy
+                samples = samples.astype(np.float32, copy=False)
+            remaining -= frames
+            yield samples.reshape(frames, ch)
+
+
+def _iter_left_blocks(wav_data, skip_frames, block_frames):
+    """Yield (index, samples) blocks of the left channel, indexed from skip_frames."""
+    index = 0
+    for block in iter_wav_blocks(wav_data, block_frames, start_frame=skip_frames):
+        # Strided view of the first column: no per-channel copy
+        yield index, block[:, 0]
+        index += len(block)
+
+
+class _AudioStats:
+    """Running state for Tests 2-5 over the left channel from first_audio onward."""
+
+    def __init__(self, first_audio, silence_threshold, chunk_size):
+        self.first_audio = first_audio
+        self.silence_threshold = silence_threshold
+        self.chunk_size = chunk_size
+
+        # Test 2: silent runs (a run still open at the end of a block carries over)
+        self.in_silence = False
+        self.silence_start = 0
+        self.gap_starts = []
+        self.gap_lengths = []
+
+        # Test 3: samples of the chunk in progress + RMS of each completed chunk
+        self.chunk_pending = np.empty(0, dtype=np.float32)
+        self.chunk_rms = []
+
+        # Tests 4 and 5
+        self.total = 0
+        self.exact_zeros = 0
+        self.max_amp = 0.0
+        self.min_amp = np.inf
+        self.max_pos = -np.inf
+
+    def update(self, index, left):
+        """Fold in a block of left-channel samples starting at analysed index `index`."""
+        if index < self.first_audio:
+            left = left[self.first_audio - index:]
+            index = self.first_audio
+        if len(left) == 0:
+            return
+        magnitude = np.abs(left)
+
+        # Run-length encode the silence mask: +1 marks a run start, -1 the sample after it ends
+        silent = magnitude < self.silence_threshold
+        edges = np.diff(silent.view(np.int8), prepend=np.int8(self.in_silence))
+        run_starts = np.flatnonzero(edges == 1) + index
+        run_ends = np.flatnonzero(edges == -1) + index
+        if self.in_silence:
+            run_starts = np.concatenate(([self.silence_start], run_starts))
+        self.in_silence = len(run_starts) > len(run_ends)
+        if self.in_silence:
+            self.silence_start = run_starts[-1]
+            run_starts = run_starts[:-1]
+        run_lengths = run_ends - run_starts
+        # Only count gaps >= 10 samples (would be audible)
+        audible_gap = run_lengths >= 10
+        self.gap_starts.append(run_starts[audible_gap])
+        self.gap_lengths.append(run_lengths[audible_gap])
+
+        pending = np.concatenate((self.chunk_pending, left))
+        num_chunks = len(pending) // self.chunk_size
+        blocks = pending[:num_chunks * self.chunk_size].reshape(num_chunks, self.chunk_size)
+        self.chunk_rms.append(np.sqrt((blocks * blocks).mean(axis=1, dtype=np.float64)))
+        self.chunk_pending = pending[num_chunks * self.chunk_size:]
+
+        self.total += len(left)
+        self.exact_zeros += np.count_nonzero(left == 0.0)
+        self.max_amp = max(self.max_amp, magnitude.max())
+        self.min_amp = min(self.min_amp, left.min())
+        self.max_pos = max(self.max_pos, left.max())
+
+    def finish(self):
+        """Concatenate per-block results once every block has been seen."""
+        self.gap_starts = np.concatenate(self.gap_starts).astype(np.int64)
+        self.gap_lengths = np.concatenate(self.gap_lengths).astype(np.int64)
+        self.chunk_rms = np.concatenate(self.chunk_rms)
+        # A chunk is only counted if audio continues past it
+        if self.total > 0 and self.total % self.chunk_size == 0:
+            self.chunk_rms = self.chunk_rms[:-1]
+        if self.total == 0:
+            self.min_amp = self.max_pos = 0
+
+
+def analyze_crackles(wav_data, skip_seconds=0.0, block_frames=65536):
+    """Analyze WAV for crackle-causing discontinuities.
+
+    Samples are streamed block by block, so memory use is bounded by
+    block_frames rather than the file length. Test 1 thresholds depend on the
+    average delta over the whole file, so the data is read a second time.
+    """
     sr = wav_data['sample_rate']
     ch = wav_data['num_channels']
     num_frames = wav_data['num_frames']
@@ -109,31 +221,48 @@ def analyze_crackles(wav_data, skip_seconds=0.0):
     print(f"Total Frames: {num_frames} ({num_frames/sr:.2f} seconds)")
     print(f"Skipping first {skip_seconds:.1f}s ({skip_frames} frames)")
 
-    # Extract left channel only (for mono analysis)
-    left = [samples[i * ch] for i in range(skip_frames, num_frames)]
+    # Only the left channel is analysed (mono analysis)
+    num_left = num_frames - skip_frames
 
-    if len(left) < 2:
+    if num_left < 2:
         print("ERROR: Not enough samples to analyze")
         return
 
+    silence_threshold = 0.001  # Below this is "silence"
+    chunk_size = sr // 60  # 735 samples at 44100Hz
+
     # ====================================================================
-    # Test 1: Sample-to-sample amplitude jumps
-    # A clean sine wave has max delta = 2*pi*f/sr ≈ small
-    # A crackle has a sudden jump in amplitude
+    # Pass 1: delta statistics and Tests 2-5
     # ====================================================================
-    print(f"\n--- Test 1: Amplitude Discontinuities ---")
-
-    deltas = []
-    for i in range(1, len(left)):
-        deltas.append(abs(left[i] - left[i-1]))
-
-    if not deltas:
-        print("No deltas to analyze")
-        return
-
-    avg_delta = sum(deltas) / len(deltas)
-    max_delta = max(deltas)
-    max_delta_idx = deltas.index(max_delta)
+    prev_sample = None
+    delta_sum = 0.0
+    max_delta = -1.0
+    max_delta_idx = 0
+    stats = None
+
+    for index, left in _iter_left_blocks(wav_data, skip_frames, block_frames):
+        # Deltas continue across the block boundary from the previous block's last sample
+        window = left if prev_sample is None else np.concatenate(([prev_sample], left))
+        delta_index = index - (len(window) - len(left))
+        deltas = np.abs(np.diff(window))
+        prev_sample = left[-1]
+        if len(deltas) > 0:
+            delta_sum += deltas.sum(dtype=np.float64)
+            # Position and value of the block maximum from a single argmax pass
+            block_max_idx = int(np.argmax(deltas))
+            if deltas[block_max_idx] > max_delta:
+                max_delta = deltas[block_max_idx]
+                max_delta_idx = delta_index + block_max_idx
+
+        # Skip initial silence (warmup)
+        if stats is None:
+            audible = np.flatnonzero(np.abs(left) > silence_threshold)
+            if len(audible) == 0:
+                continue
+            stats = _AudioStats(index + int(audible[0]), silence_threshold, chunk_size)
+        stats.update(index, left)
+
+    avg_delta = delta_sum / (num_left - 1)
 
     # Threshold: a jump > 10x the average delta is suspicious
     # For a smooth sine, jumps should be very uniform
@@ -141,23 +270,67 @@ def analyze_crackles(wav_data, skip_seconds=0.0):
     threshold_20x = avg_delta * 20
     threshold_50x = avg_delta * 50
 
-    jumps_10x = [(i + skip_frames, deltas[i]) for i in range(len(deltas)) if deltas[i] > threshold_10x]
-    jumps_20x = [(i + skip_frames, deltas[i]) for i in range(len(deltas)) if deltas[i] > threshold_20x]
-    jumps_50x = [(i + skip_frames, deltas[i]) for i in range(len(deltas)) if deltas[i] > threshold_50x]
+    # Nothing audible at all: Tests 2-5 cover the whole signal, fed during pass 2
+    needs_stats = stats is None
+    if needs_stats:
+        stats = _AudioStats(0, silence_threshold, chunk_size)
+
+    # ====================================================================
+    # Pass 2: classify amplitude jumps against the global average
+    # ====================================================================
+    num_jumps_10x = 0
+    num_jumps_20x = 0
+    num_jumps_50x = 0
+    first_jumps_20x = []  # (frame, delta, before, after)
+    tail = np.empty(0, dtype=np.float32)  # last two samples of the previous block, for before/after context
+
+    for index, left in _iter_left_blocks(wav_data, skip_frames, block_frames):
+        window = np.concatenate((tail, left))
+        window_index = index - len(tail)
+        first = max(len(tail) - 1, 0)
+        deltas = np.abs(np.diff(window[first:]))
+
+        # The thresholds are nested, so one full scan finds every 10x jump and the
+        # 20x/50x checks only look at those candidates
+        jumps_10x = np.flatnonzero(deltas > threshold_10x)
+        candidates = deltas[jumps_10x]
+        jumps_20x = jumps_10x[candidates > threshold_20x]
+        num_jumps_10x += len(jumps_10x)
+        num_jumps_20x += len(jumps_20x)
+        num_jumps_50x += np.count_nonzero(candidates > threshold_50x)
+
+        for k in jumps_20x[:20 - len(first_jumps_20x)]:
+            # deltas[k] spans window[pos] -> window[pos + 1], so pos is the last sample
+            # before the jump; reporting it as frame/"after" keeps the original report's
+            # frame/before/after convention
+            pos = first + k
+            before = window[pos - 1] if window_index + pos > 0 else 0
+            first_jumps_20x.append((window_index + pos + skip_frames, deltas[k], before, window[pos]))
+
+        tail = window[-2:]
+        if needs_stats:
+            stats.update(index, left)
+
+    stats.finish()
+    first_audio = stats.first_audio
+
+    # ====================================================================
+    # Test 1: Sample-to-sample amplitude jumps
+    # A clean sine wave has max delta = 2*pi*f/sr ≈ small
+    # A crackle has a sudden jump in amplitude
+    # ====================================================================
+    print(f"\n--- Test 1: Amplitude Discontinuities ---")
 
     print(f"  Average sample delta: {avg_delta:.6f}")
     print(f"  Max sample delta:     {max_delta:.6f} at frame {max_delta_idx + skip_frames} ({(max_delta_idx + skip_frames)/sr:.4f}s)")
-    print(f"  Jumps > 10x avg ({threshold_10x:.6f}): {len(jumps_10x)}")
-    print(f"  Jumps > 20x avg ({threshold_20x:.6f}): {len(jumps_20x)}")
-    print(f"  Jumps > 50x avg ({threshold_50x:.6f}): {len(jumps_50x)}")
+    print(f"  Jumps > 10x avg ({threshold_10x:.6f}): {num_jumps_10x}")
+    print(f"  Jumps > 20x avg ({threshold_20x:.6f}): {num_jumps_20x}")
+    print(f"  Jumps > 50x avg ({threshold_50x:.6f}): {num_jumps_50x}")
 
-    if jumps_20x:
+    if first_jumps_20x:
         print(f"\n  First 20 jumps > 20x avg:")
-        for frame, delta in jumps_20x[:20]:
+        for frame, delta, before, after in first_jumps_20x:
             time_s = frame / sr
-            idx = frame - skip_frames
-            before = left[idx - 1] if idx > 0 else 0
-            after = left[idx]
             print(f"    Frame {frame} ({time_s:.4f}s): delta={delta:.6f}, before={before:.6f}, after={after:.6f}")
 
     # ====================================================================
@@ -165,38 +338,17 @@ def analyze_crackles(wav_data, skip_seconds=0.0):
     # ====================================================================
     print(f"\n--- Test 2: Silent Gaps ---")
 
-    silence_threshold = 0.001  # Below this is "silence"
-    in_silence = False
-    silence_start = 0
-    gaps = []
-
-    # Skip initial silence (warmup)
-    first_audio = 0
-    for i in range(len(left)):
-        if abs(left[i]) > silence_threshold:
-            first_audio = i
-            break
-
     print(f"  First non-silent frame: {first_audio + skip_frames} ({(first_audio + skip_frames)/sr:.4f}s)")
 
-    for i in range(first_audio, len(left)):
-        if abs(left[i]) < silence_threshold:
-            if not in_silence:
-                silence_start = i
-                in_silence = True
-        else:
-            if in_silence:
-                gap_len = i - silence_start
-                if gap_len >= 10:  # Only count gaps >= 10 samples (would be audible)
-                    gaps.append((silence_start + skip_frames, gap_len))
-                in_silence = False
-
-    print(f"  Silent gaps (>= 10 samples) after first audio: {len(gaps)}")
-    if gaps:
-        total_gap_samples = sum(g[1] for g in gaps)
+    gap_frames = stats.gap_starts + skip_frames
+    gap_lengths = stats.gap_lengths
+
+    print(f"  Silent gaps (>= 10 samples) after first audio: {len(gap_lengths)}")
+    if len(gap_lengths) > 0:
+        total_gap_samples = gap_lengths.sum()
         print(f"  Total gap samples: {total_gap_samples} ({total_gap_samples/sr*1000:.1f}ms)")
         print(f"  First 10 gaps:")
-        for frame, length in gaps[:10]:
+        for frame, length in zip(gap_frames[:10], gap_lengths[:10]):
             print(f"    Frame {frame} ({frame/sr:.4f}s): {length} samples ({length/sr*1000:.2f}ms)")
 
     # ====================================================================
@@ -204,38 +356,38 @@ def analyze_crackles(wav_data, skip_seconds=0.0):
     # ====================================================================
     print(f"\n--- Test 3: RMS Energy Analysis (per 735-sample chunk = 1/60s) ---")
 
-    chunk_size = sr // 60  # 735 samples at 44100Hz
-    chunks = []
-    for i in range(first_audio, len(left) - chunk_size, chunk_size):
-        rms = math.sqrt(sum(s*s for s in left[i:i+chunk_size]) / chunk_size)
-        chunks.append((i + skip_frames, rms))
+    # Whole chunks starting at first_audio
+    rms_values = stats.chunk_rms
+    num_chunks = len(rms_values)
+    low_energy = np.empty(0, dtype=np.intp)
 
-    if chunks:
-        rms_values = [c[1] for c in chunks]
-        avg_rms = sum(rms_values) / len(rms_values)
+    if num_chunks > 0:
+        avg_rms = rms_values.mean()
 
         # Find chunks with RMS < 20% of average (suspicious drops)
-        low_energy = [(f, r) for f, r in chunks if r < avg_rms * 0.2 and avg_rms > 0.01]
-        high_energy = [(f, r) for f, r in chunks if r > avg_rms * 3.0]
+        if avg_rms > 0.01:
+            low_energy = np.flatnonzero(rms_values < avg_rms * 0.2)
+        high_energy = np.flatnonzero(rms_values > avg_rms * 3.0)
 
         print(f"  Average RMS: {avg_rms:.6f}")
-        print(f"  Min RMS: {min(rms_values):.6f}")
-        print(f"  Max RMS: {max(rms_values):.6f}")
+        print(f"  Min RMS: {rms_values.min():.6f}")
+        print(f"  Max RMS: {rms_values.max():.6f}")
         print(f"  Low energy chunks (< 20% avg): {len(low_energy)}")
         print(f"  High energy chunks (> 3x avg): {len(high_energy)}")
 
-        if low_energy:
+        if len(low_energy) > 0:
             print(f"  First 10 low-energy chunks:")
-            for frame, rms in low_energy[:10]:
-                print(f"    Frame {frame} ({frame/sr:.4f}s): RMS={rms:.6f}")
+            for c in low_energy[:10]:
+                frame = first_audio + c * chunk_size + skip_frames
+                print(f"    Frame {frame} ({frame/sr:.4f}s): RMS={rms_values[c]:.6f}")
 
     # ====================================================================
     # Test 4: Zero-sample analysis (exact zeros indicate buffer underrun)
     # ====================================================================
     print(f"\n--- Test 4: Exact Zero Samples ---")
 
-    exact_zeros = sum(1 for s in left[first_audio:] if s == 0.0)
-    total_after_first = len(left) - first_audio
+    exact_zeros = stats.exact_zeros
+    total_after_first = stats.total
     pct_zeros = (exact_zeros / total_after_first * 100) if total_after_first > 0 else 0
 
     print(f"  Exact zeros after first audio: {exact_zeros} / {total_after_first} ({pct_zeros:.2f}%)")
@@ -245,9 +397,9 @@ def analyze_crackles(wav_data, skip_seconds=0.0):
     # ====================================================================
     print(f"\n--- Test 5: Amplitude Statistics ---")
 
-    max_amp = max(abs(s) for s in left[first_audio:]) if left[first_audio:] else 0
-    min_amp = min(left[first_audio:]) if left[first_audio:] else 0
-    max_pos = max(left[first_audio:]) if left[first_audio:] else 0
+    max_amp = stats.max_amp
+    min_amp = stats.min_amp
+    max_pos = stats.max_pos
 
     print(f"  Peak amplitude: {max_amp:.6f}")
     print(f"  Min sample: {min_amp:.6f}")
@@ -259,10 +411,10 @@ def analyze_crackles(wav_data, skip_seconds=0.0):
     print(f"\n=== VERDICT ===")
     issues = []
 
-    if len(jumps_20x) > 0:
-        issues.append(f"CRACKLE: {len(jumps_20x)} amplitude discontinuities > 20x average")
-    if len(gaps) > 0:
-        issues.append(f"CRACKLE: {len(gaps)} silent gaps detected")
+    if num_jumps_20x > 0:
+        issues.append(f"CRACKLE: {num_jumps_20x} amplitude discontinuities > 20x average")
+    if len(gap_lengths) > 0:
+        issues.append(f"CRACKLE: {len(gap_lengths)} silent gaps detected")
     if pct_zeros > 1.0:
         issues.append(f"WARNING: {pct_zeros:.1f}% exact zeros (possible underruns)")
     if len(low_energy) > 0:
@@ -289,6 +441,6 @@ if __name__ == '__main__':
         print(f"ERROR: File not found: {filepath}")
         sys.exit(1)
 
-    wav = read_wav(filepath)
+    wav = read_wav_header(filepath)
     clean = analyze_crackles(wav, skip_seconds=skip)
     sys.exit(0 if clean else 1)